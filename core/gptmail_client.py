@@ -2,14 +2,149 @@
 GPTMail客户端 - 基于 mail.chatgpt.org.uk 的临时邮箱服务
 """
 
-import time
+import asyncio
+import json
+import threading
 from datetime import datetime
 from typing import Optional
 from urllib.parse import quote
 
-from curl_cffi import requests
+from curl_cffi.requests import AsyncSession
 
-from core.mail_utils import extract_verification_code
+from core.mail_utils import (
+    extract_verification_code,
+    looks_like_html,
+    strip_html_tags,
+)
+
+# 生成邮箱重试退避参数
+_RETRY_BASE_DELAY_SECONDS = 0.1
+_RETRY_MAX_DELAY_SECONDS = 8.0
+# 所有重试累计等待上限，持续失败时不慢于原先固定 1 秒间隔（约 9 秒）；
+# 服务端 Retry-After 超出剩余额度时直接放弃
+_RETRY_TOTAL_BUDGET_SECONDS = 8.0
+
+# 邮件时间解析缓存上限（超出后整体清空）
+_TIME_CACHE_MAX_SIZE = 256
+
+# 所有 GPTMail 客户端共用一个后台事件循环，多个账户的轮询在同一线程上并发执行
+_mail_loop = None
+_mail_thread = None
+_mail_loop_lock = threading.Lock()
+
+
+def _ensure_mail_loop() -> asyncio.AbstractEventLoop:
+    global _mail_loop, _mail_thread
+    if _mail_loop and _mail_thread and _mail_thread.is_alive():
+        return _mail_loop
+    with _mail_loop_lock:
+        if _mail_loop and _mail_thread and _mail_thread.is_alive():
+            return _mail_loop
+        loop = asyncio.new_event_loop()
+
+        def _runner() -> None:
+            asyncio.set_event_loop(loop)
+            loop.run_forever()
+
+        thread = threading.Thread(target=_runner, name="gptmail-loop", daemon=True)
+        thread.start()
+        _mail_loop = loop
+        _mail_thread = thread
+        return _mail_loop
+
+
+def _run_in_mail_loop(coro):
+    loop = _ensure_mail_loop()
+    if _on_mail_loop():
+        coro.close()
+        raise RuntimeError("GPTMail sync API cannot be called from the GPTMail loop; await the async variant")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    return future.result()
+
+
+def _on_mail_loop() -> bool:
+    try:
+        return asyncio.get_running_loop() is _mail_loop
+    except RuntimeError:
+        return False
+
+
+async def _await_on_mail_loop(coro):
+    """在任意事件循环中等待 coro：共享 session 绑定 GPTMail 事件循环，其他循环中调用时转交过去执行"""
+    loop = _ensure_mail_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+# 按 (proxy, verify_ssl) 共享 session，复用到 GPTMail 的 TCP/TLS 连接
+# AsyncSession 基于 curl_multi，同源并发请求在同一 HTTP/2 连接上多路复用，
+# 由 session 自己管理 curl 句柄池，避免多个协程并发复用同一个句柄
+_SESSION_MAX_CLIENTS = 50
+_session_cache: dict[tuple, AsyncSession] = {}
+_session_refs: dict[tuple, int] = {}
+_session_lock = threading.Lock()
+
+
+def _session_key(proxy: str, verify_ssl: bool) -> tuple:
+    return (proxy or "", bool(verify_ssl))
+
+
+def _acquire_session(key: tuple) -> None:
+    with _session_lock:
+        _session_refs[key] = _session_refs.get(key, 0) + 1
+
+
+def _release_session(key: tuple) -> Optional[AsyncSession]:
+    """释放引用，最后一个引用释放时返回需要关闭的 session"""
+    with _session_lock:
+        count = _session_refs.get(key, 0) - 1
+        if count > 0:
+            _session_refs[key] = count
+            return None
+        _session_refs.pop(key, None)
+        return _session_cache.pop(key, None)
+
+
+def _get_session(proxy: str, verify_ssl: bool) -> AsyncSession:
+    """获取共享 session（AsyncSession 绑定事件循环，需在 GPTMail 事件循环内调用）"""
+    key = _session_key(proxy, verify_ssl)
+    with _session_lock:
+        session = _session_cache.get(key)
+        if session is None:
+            session = AsyncSession(
+                impersonate="edge101",
+                max_clients=_SESSION_MAX_CLIENTS,
+                verify=verify_ssl,
+                proxies={"http": proxy, "https": proxy} if proxy else None,
+            )
+            _session_cache[key] = session
+        return session
+
+
+def _as_aware(value: Optional[datetime]) -> Optional[datetime]:
+    """不带时区的时间按本地时区解释，转为带时区时间"""
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.astimezone()
+
+
+def _retry_after(response) -> Optional[float]:
+    """解析响应中的 Retry-After（秒），没有或无法解析时返回 None"""
+    if response is None:
+        return None
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        return None
+
+
+def _retry_delay(attempt: int) -> float:
+    """指数退避等待时间"""
+    return min(_RETRY_MAX_DELAY_SECONDS, (2 ** attempt) * _RETRY_BASE_DELAY_SECONDS)
 
 
 class GPTMailClient:
@@ -29,15 +164,16 @@ class GPTMailClient:
         self.domain_filter = (domain or "").strip()
         self.log_callback = log_callback
 
+        self.verify_ssl = verify_ssl
+
         self.email: Optional[str] = None
         self.password: Optional[str] = None  # 临时邮箱无密码，保留接口兼容
 
-        self.session = requests.Session(
-            impersonate="edge101",
-            verify=verify_ssl,
-        )
-        if proxy:
-            self.session.proxies = {"http": proxy, "https": proxy}
+        self._session_key: Optional[tuple] = _session_key(proxy, verify_ssl)
+        _acquire_session(self._session_key)
+
+        # 邮件时间解析缓存，轮询时同一封邮件无需重复解析
+        self._time_cache: dict[tuple, datetime] = {}
 
     def _log(self, level: str, message: str) -> None:
         if self.log_callback:
@@ -46,16 +182,34 @@ class GPTMailClient:
             except Exception:
                 pass
 
+    @property
+    def session(self) -> AsyncSession:
+        return _get_session(self.proxy, self.verify_ssl)
+
     def register_account(self, domain: Optional[str] = None) -> bool:
+        """生成临时邮箱（同步接口）"""
+        return _run_in_mail_loop(self._register_account(domain=domain))
+
+    async def register_account_async(self, domain: Optional[str] = None) -> bool:
+        """生成临时邮箱（可在任意事件循环中 await）"""
+        return await _await_on_mail_loop(self._register_account(domain=domain))
+
+    async def _register_account(self, domain: Optional[str] = None) -> bool:
         """生成临时邮箱"""
         url = f"{self.base_url}/api/generate-email"
         headers = {"Referer": f"{self.base_url}/"}
         filter_domain = domain or self.domain_filter
 
         max_attempts = 10
+        waited = 0.0
         for attempt in range(max_attempts):
+            response = None
             try:
-                response = self.session.get(url, headers=headers, timeout=15)
+                response = await self.session.get(url, headers=headers, timeout=15)
+                if response.status_code in (401, 403):
+                    # 鉴权失败重试无意义，直接放弃
+                    self._log("error", f"GPTMail 生成邮箱被拒绝: HTTP {response.status_code}")
+                    return False
                 if response.status_code == 200:
                     data = response.json()
                     if data.get("success"):
@@ -73,10 +227,24 @@ class GPTMailClient:
                         self._log("info", f"GPTMail 生成邮箱: {self.email}")
                         return True
                 self._log("warning", f"GPTMail 生成邮箱失败，重试 ({attempt + 1}/{max_attempts})")
-                time.sleep(1)
             except Exception as e:
                 self._log("error", f"GPTMail 生成邮箱异常: {e}")
-                time.sleep(1)
+
+            if attempt < max_attempts - 1:
+                remaining = _RETRY_TOTAL_BUDGET_SECONDS - waited
+                retry_after = _retry_after(response)
+                if retry_after is not None:
+                    # 提前重试只会再次被拒，等待时间不够时直接放弃
+                    if retry_after > remaining:
+                        self._log("warning", f"GPTMail 要求 {retry_after:.0f} 秒后重试，超出等待上限")
+                        break
+                    delay = retry_after
+                else:
+                    if remaining <= 0:
+                        break
+                    delay = min(_retry_delay(attempt), remaining)
+                await asyncio.sleep(delay)
+                waited += delay
 
         self._log("error", "GPTMail 生成邮箱失败")
         return False
@@ -90,14 +258,14 @@ class GPTMailClient:
         """登录（临时邮箱不需要登录）"""
         return True
 
-    def _get_emails(self) -> Optional[list]:
+    async def _get_emails(self) -> Optional[list]:
         """获取邮件列表"""
         if not self.email:
             return None
         url = f"{self.base_url}/api/emails?email={quote(self.email)}"
         headers = {"Referer": f"{self.base_url}/"}
         try:
-            response = self.session.get(url, headers=headers, timeout=15)
+            response = await self.session.get(url, headers=headers, timeout=15)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("success"):
@@ -107,14 +275,24 @@ class GPTMailClient:
         return None
 
     def fetch_verification_code(self, since_time: Optional[datetime] = None) -> Optional[str]:
+        """获取验证码（同步接口）"""
+        return _run_in_mail_loop(self._fetch_verification_code(since_time=since_time))
+
+    async def fetch_verification_code_async(self, since_time: Optional[datetime] = None) -> Optional[str]:
+        """获取验证码（可在任意事件循环中 await）"""
+        return await _await_on_mail_loop(self._fetch_verification_code(since_time=since_time))
+
+    async def _fetch_verification_code(self, since_time: Optional[datetime] = None) -> Optional[str]:
         """获取验证码"""
         if not self.email:
             self._log("error", "未生成邮箱")
             return None
 
+        since_time = _as_aware(since_time)
+
         try:
             self._log("info", "GPTMail 获取邮件列表")
-            emails = self._get_emails()
+            emails = await self._get_emails()
             if not emails:
                 self._log("info", "GPTMail 邮件列表为空")
                 return None
@@ -122,72 +300,254 @@ class GPTMailClient:
             self._log("info", f"GPTMail 收到 {len(emails)} 封邮件")
             for idx, email_item in enumerate(emails):
                 self._log("info", f"GPTMail 邮件[{idx}]: {email_item}")
-
-                # 时间过滤
-                if since_time:
-                    email_time_str = email_item.get("date") or email_item.get("time")
-                    if email_time_str:
-                        try:
-                            email_time = datetime.fromisoformat(
-                                email_time_str.replace("Z", "+00:00")
-                            ).astimezone().replace(tzinfo=None)
-                            if email_time < since_time:
-                                continue
-                        except Exception:
-                            pass
-
-                # 从主题提取验证码
-                subject = email_item.get("subject", "")
-                code = extract_verification_code(subject)
+                code = self._extract_code_from_email(email_item, since_time)
                 if code:
-                    self._log("info", f"GPTMail 从主题提取验证码: {code}")
                     return code
 
-                # 从邮件内容提取验证码（字段名: content, body, text, html_content）
-                body = (
-                    email_item.get("content", "")
-                    or email_item.get("body", "")
-                    or email_item.get("text", "")
-                    or email_item.get("html_content", "")
-                )
-                if body:
-                    code = extract_verification_code(body)
-                    if code:
-                        self._log("info", f"GPTMail 从内容提取验证码: {code}")
-                        return code
-
             return None
 
         except Exception as e:
             self._log("error", f"GPTMail 获取验证码异常: {e}")
             return None
 
+    def _parse_email_time(self, email_id, email_time_str: str) -> datetime:
+        """解析邮件时间为带时区时间（按邮件 ID + 时间字符串缓存）"""
+        key = (email_id, email_time_str)
+        email_time = self._time_cache.get(key)
+        if email_time is None:
+            email_time = _as_aware(datetime.fromisoformat(email_time_str.replace("Z", "+00:00")))
+            if len(self._time_cache) >= _TIME_CACHE_MAX_SIZE:
+                self._time_cache.clear()
+            self._time_cache[key] = email_time
+        return email_time
+
+    def _extract_code_from_email(self, email_item: dict, since_time: Optional[datetime]) -> Optional[str]:
+        """从单封邮件中提取验证码（早于 since_time 的邮件跳过）"""
+        # 时间过滤
+        if since_time:
+            email_time_str = email_item.get("date") or email_item.get("time")
+            if email_time_str:
+                try:
+                    email_time = self._parse_email_time(email_item.get("id"), email_time_str)
+                    if email_time < since_time:
+                        return None
+                except Exception:
+                    pass
+
+        # 从主题提取验证码
+        subject = email_item.get("subject", "")
+        code = extract_verification_code(subject)
+        if code:
+            self._log("info", f"GPTMail 从主题提取验证码: {code}")
+            return code
+
+        # 从邮件内容提取验证码（字段名: content, body, text, html_content）
+        body = (
+            email_item.get("content", "")
+            or email_item.get("body", "")
+            or email_item.get("text", "")
+            or email_item.get("html_content", "")
+        )
+        if body:
+            # HTML 内容先去标签，避免样式里的颜色值等被误识别为验证码
+            if looks_like_html(body):
+                body = strip_html_tags(body)
+            code = extract_verification_code(body)
+            if code:
+                self._log("info", f"GPTMail 从内容提取验证码: {code}")
+                return code
+
+        return None
+
     def poll_for_code(
         self,
         timeout: int = 120,
         interval: int = 4,
         since_time: Optional[datetime] = None,
     ) -> Optional[str]:
-        """轮询获取验证码"""
+        """轮询获取验证码（同步接口，供浏览器自动化线程调用）"""
+        return _run_in_mail_loop(
+            self._poll_for_code(timeout=timeout, interval=interval, since_time=since_time)
+        )
+
+    async def poll_for_code_async(
+        self,
+        timeout: int = 120,
+        interval: int = 4,
+        since_time: Optional[datetime] = None,
+    ) -> Optional[str]:
+        """轮询获取验证码（可在任意事件循环中 await）"""
+        return await _await_on_mail_loop(
+            self._poll_for_code(timeout=timeout, interval=interval, since_time=since_time)
+        )
+
+    async def _poll_for_code(
+        self,
+        timeout: int = 120,
+        interval: int = 4,
+        since_time: Optional[datetime] = None,
+    ) -> Optional[str]:
+        """
+        轮询获取验证码
+
+        since_time 应为带时区时间（推荐 UTC）；不带时区时按本地时间解释，
+        在每次拉取前转换一次，邮件时间直接与之比较。
+        """
+        since_time = _as_aware(since_time)
         max_retries = timeout // interval
 
         for i in range(1, max_retries + 1):
-            code = self.fetch_verification_code(since_time=since_time)
+            code = await self._fetch_verification_code(since_time=since_time)
             if code:
                 return code
 
             if i < max_retries:
                 self._log("info", f"GPTMail 等待验证码... ({i * interval}s/{timeout}s)")
-                time.sleep(interval)
+                await asyncio.sleep(interval)
 
         self._log("error", "GPTMail 获取验证码超时")
         return None
 
+    def stream_for_code(
+        self,
+        timeout: int = 120,
+        interval: int = 4,
+        since_time: Optional[datetime] = None,
+    ) -> Optional[str]:
+        """通过推送获取验证码（同步接口）"""
+        return _run_in_mail_loop(
+            self._stream_for_code(timeout=timeout, interval=interval, since_time=since_time)
+        )
+
+    async def stream_for_code_async(
+        self,
+        timeout: int = 120,
+        interval: int = 4,
+        since_time: Optional[datetime] = None,
+    ) -> Optional[str]:
+        """通过推送获取验证码（可在任意事件循环中 await）"""
+        return await _await_on_mail_loop(
+            self._stream_for_code(timeout=timeout, interval=interval, since_time=since_time)
+        )
+
+    async def _stream_for_code(
+        self,
+        timeout: int = 120,
+        interval: int = 4,
+        since_time: Optional[datetime] = None,
+    ) -> Optional[str]:
+        """
+        通过 SSE 推送获取验证码，收到验证码立即返回
+
+        服务端不支持推送（非 200 或非 text/event-stream）或连接中断时，
+        用剩余时间回退到 poll_for_code 轮询。
+        """
+        if not self.email:
+            self._log("error", "未生成邮箱")
+            return None
+
+        since_time = _as_aware(since_time)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        url = f"{self.base_url}/api/emails/stream?email={quote(self.email)}"
+        headers = {"Referer": f"{self.base_url}/", "Accept": "text/event-stream"}
+        response = None
+        try:
+            response = await self.session.get(url, headers=headers, stream=True, timeout=timeout)
+            content_type = response.headers.get("Content-Type") or ""
+            if response.status_code == 200 and "text/event-stream" in content_type:
+                self._log("info", "GPTMail 等待推送验证码...")
+                code = await asyncio.wait_for(
+                    self._read_code_stream(response, since_time),
+                    timeout=max(0.0, deadline - loop.time()),
+                )
+                if code:
+                    return code
+            else:
+                self._log("info", f"GPTMail 不支持推送 (HTTP {response.status_code})，回退到轮询")
+        except asyncio.TimeoutError:
+            self._log("error", "GPTMail 获取验证码超时")
+            return None
+        except Exception as e:
+            self._log("warning", f"GPTMail 推送连接异常: {e}，回退到轮询")
+        finally:
+            if response is not None:
+                try:
+                    await response.aclose()
+                except Exception:
+                    pass
+
+        remaining = int(deadline - loop.time())
+        if remaining < interval:
+            self._log("error", "GPTMail 获取验证码超时")
+            return None
+        return await self._poll_for_code(timeout=remaining, interval=interval, since_time=since_time)
+
+    async def _read_code_stream(self, response, since_time: Optional[datetime]) -> Optional[str]:
+        """解析 text/event-stream，返回第一个匹配的验证码"""
+        data_lines: list = []
+        async for line in response.aiter_lines():
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="ignore")
+            line = line.rstrip("\r")
+            if line:
+                # 同一事件的多行 data 字段按规范以换行拼接，空行才表示事件结束
+                if line.startswith("data:"):
+                    value = line[5:]
+                    data_lines.append(value[1:] if value.startswith(" ") else value)
+                continue
+            if not data_lines:
+                continue
+            data = "\n".join(data_lines)
+            data_lines = []
+
+            # 只处理 JSON 邮件数据；心跳、连接提示等纯文本事件直接忽略
+            try:
+                payload = json.loads(data)
+            except ValueError:
+                continue
+
+            if isinstance(payload, dict):
+                items = [payload]
+            elif isinstance(payload, list):
+                items = [item for item in payload if isinstance(item, dict)]
+            else:
+                continue
+
+            for email_item in items:
+                code = self._extract_code_from_email(email_item, since_time)
+                if code:
+                    return code
+        return None
+
     def close(self) -> None:
-        """关闭 session"""
-        if self.session:
+        """释放共享 session，最后一个客户端关闭时才真正关闭连接"""
+        if self._session_key is None:
+            return
+        session = _release_session(self._session_key)
+        self._session_key = None
+        if session:
             try:
-                self.session.close()
+                if _on_mail_loop():
+                    # 在 GPTMail 事件循环内不能阻塞等待自身，改为调度关闭
+                    asyncio.get_running_loop().create_task(session.close())
+                else:
+                    _run_in_mail_loop(session.close())
             except Exception:
                 pass
-            self.session = None
+
+
+async def gather_codes(clients: list, **kwargs) -> list:
+    """
+    并发轮询多个 GPTMail 客户端的验证码，参数同 poll_for_code
+
+    使用 return_exceptions=True：单个邮箱异常不会中断整批，
+    结果列表中对应位置为异常对象，调用方需自行判断。
+    """
+    async def _gather() -> list:
+        return await asyncio.gather(
+            *(client._poll_for_code(**kwargs) for client in clients),
+            return_exceptions=True,
+        )
+
+    return await _await_on_mail_loop(_gather())
@@ -1,6 +1,31 @@
 import re
 from typing import Optional
 
+# 预编译验证码匹配规则，避免每封邮件重复查找正则缓存
+_CONTEXT_CODE_PATTERN = r"(?:验证码|code|verification|passcode|pin).*?(?::|：)\s*([A-Za-z0-9]{4,8})\b"
+_CSS_UNIT_PATTERN = r"^\d+(?:px|pt|em|rem|vh|vw|%)$"
+_ALNUM_CODE_PATTERN = r"[A-Z0-9]{6}"
+_DIGIT_CODE_PATTERN = r"\b\d{6}\b"
+
+_CONTEXT_CODE_RE = re.compile(_CONTEXT_CODE_PATTERN, re.IGNORECASE)
+_CSS_UNIT_RE = re.compile(_CSS_UNIT_PATTERN, re.IGNORECASE)
+_ALNUM_CODE_RE = re.compile(_ALNUM_CODE_PATTERN)
+_DIGIT_CODE_RE = re.compile(_DIGIT_CODE_PATTERN)
+
+_HTML_BLOCK_RE = re.compile(r"<(style|script)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_HTML_TAG_START_RE = re.compile(r"<[a-zA-Z/!]")
+
+
+def looks_like_html(text: str) -> bool:
+    """判断文本是否包含 HTML 标签（仅有比较符号 < 的纯文本不算）"""
+    return bool(_HTML_TAG_START_RE.search(text))
+
+
+def strip_html_tags(html: str) -> str:
+    """去除 HTML 标签及 style/script 块，避免样式（颜色值等）干扰验证码匹配"""
+    return _HTML_TAG_RE.sub(" ", _HTML_BLOCK_RE.sub(" ", html))
+
 
 def extract_verification_code(text: str) -> Optional[str]:
     """提取验证码"""
@@ -8,22 +33,22 @@ def extract_verification_code(text: str) -> Optional[str]:
         return None
 
     # 策略1: 上下文关键词匹配（中英文冒号）
-    context_pattern = r"(?:验证码|code|verification|passcode|pin).*?[:：]\s*([A-Za-z0-9]{4,8})\b"
-    match = re.search(context_pattern, text, re.IGNORECASE)
+    match = _CONTEXT_CODE_RE.search(text)
     if match:
         candidate = match.group(1)
         # 排除 CSS 单位值
-        if not re.match(r"^\d+(?:px|pt|em|rem|vh|vw|%)$", candidate, re.IGNORECASE):
+        if not _CSS_UNIT_RE.match(candidate):
             return candidate
 
     # 策略2: 6位字母数字混合（与测试代码一致，优先级提高）
-    match = re.search(r"[A-Z0-9]{6}", text)
+    match = _ALNUM_CODE_RE.search(text)
     if match:
         return match.group(0)
 
     # 策略3: 6位数字（降级为备选）
-    digits = re.findall(r"\b\d{6}\b", text)
-    if digits:
-        return digits[0]
+    match = _DIGIT_CODE_RE.search(text)
+    if match:
+        return match.group(0)
 
     return None
+
@@ -5,24 +5,54 @@ If DATABASE_URL is set, PostgreSQL is used.
 """
 
 import asyncio
+import copy
+import functools
+import itertools
 import json
 import logging
 import os
 import threading
+import time
+from datetime import timezone
 from typing import Optional
 
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # orjson 可选，缺失时使用标准库 json
+    orjson = None
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# asyncpg 连接池绑定创建它的事件循环：全进程只在专用的后台事件循环上维护一个连接池。
+# 账户/设置模块在请求处理中（主循环线程内）同步调用存储，无法在主循环上等待结果，
+# 因此保留后台线程：同步包装函数阻塞等待该循环执行结果；异步函数经 _on_db_loop
+# 转交该循环执行，调用方在自己的事件循环中 await，不会阻塞
 _db_pool = None
 _db_pool_lock = None
 _db_loop = None
 _db_thread = None
 _db_loop_lock = threading.Lock()
 
+# 连接数上限与原先的单个连接池一致（10）：连接池占 9 个，账户变更监听连接占 1 个
+_DB_POOL_MAX_SIZE = 9
+
+# 账户变更通知频道（LISTEN/NOTIFY）
+ACCOUNTS_CHANGED_CHANNEL = "accounts_changed"
+
+# 建表 DDL 的 advisory lock 键，串行化多进程（多个实例）的并发初始化
+_INIT_TABLES_LOCK_KEY = 0x6765_6d69
+
+# kv_store 读缓存（设置/统计读多写少），key -> (缓存时间, 值)；本进程写入时失效
+_KV_CACHE_TTL_SECONDS = 5.0
+_kv_cache: dict[str, tuple[float, dict]] = {}
+# 每个 key 的写入版本，避免写入前发起的读取在写入后回填旧值
+_kv_versions: dict[str, int] = {}
+_kv_write_counter = itertools.count(1)
+
 
 def _get_database_url() -> str:
     return os.environ.get("DATABASE_URL", "").strip()
@@ -55,10 +85,33 @@ def _ensure_db_loop() -> asyncio.AbstractEventLoop:
 
 def _run_in_db_loop(coro):
     loop = _ensure_db_loop()
+    if _on_db_loop_thread():
+        # 在数据库事件循环内阻塞等待自身会死锁
+        coro.close()
+        raise RuntimeError("Storage sync API cannot be called from the storage loop; await the async variant")
     future = asyncio.run_coroutine_threadsafe(coro, loop)
     return future.result()
 
 
+def _on_db_loop_thread() -> bool:
+    try:
+        return asyncio.get_running_loop() is _db_loop
+    except RuntimeError:
+        return False
+
+
+def _on_db_loop(func):
+    """Run an async storage function on the DB loop so it can be awaited from any loop."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = _ensure_db_loop()
+        if _on_db_loop_thread():
+            return await func(*args, **kwargs)
+        future = asyncio.run_coroutine_threadsafe(func(*args, **kwargs), loop)
+        return await asyncio.wrap_future(future)
+    return wrapper
+
+
 async def _get_pool():
     """Get (or create) the asyncpg connection pool."""
     global _db_pool, _db_pool_lock
@@ -74,13 +127,15 @@ async def _get_pool():
             raise ValueError("DATABASE_URL is not set")
         try:
             import asyncpg
-            _db_pool = await asyncpg.create_pool(
+            pool = await asyncpg.create_pool(
                 db_url,
                 min_size=1,
-                max_size=10,
+                max_size=_DB_POOL_MAX_SIZE,
                 command_timeout=30,
+                init=_init_connection,
             )
-            await _init_tables(_db_pool)
+            await _init_tables(pool)
+            _db_pool = pool
             logger.info("[STORAGE] PostgreSQL pool initialized")
         except ImportError:
             logger.error("[STORAGE] asyncpg is required for database storage")
@@ -91,9 +146,37 @@ async def _get_pool():
     return _db_pool
 
 
+def _json_dumps(value) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # 超出 64 位的整数、不支持的类型等：交给标准库处理
+            pass
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _json_loads(data):
+    # 解码固定用标准库：orjson 会把超出 64 位的整数静默转成 float
+    return json.loads(data)
+
+
+async def _init_connection(conn) -> None:
+    """Register the JSONB codec so dicts are passed to/from asyncpg directly."""
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=_json_dumps,
+        decoder=_json_loads,
+        schema="pg_catalog",
+        format="text",
+    )
+
+
 async def _init_tables(pool) -> None:
     """Initialize database tables."""
-    async with pool.acquire() as conn:
+    async with pool.acquire() as conn, conn.transaction():
+        # 多个事件循环/进程可能同时初始化，事务级 advisory lock 串行化 DDL
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _INIT_TABLES_LOCK_KEY)
         # 创建 kv_store 表（用于设置和统计）
         await conn.execute(
             """
@@ -142,11 +225,56 @@ async def _init_tables(pool) -> None:
             CREATE INDEX IF NOT EXISTS idx_accounts_expires_at ON accounts(expires_at)
             """
         )
+        await conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_accounts_updated_at ON accounts(updated_at DESC)
+            """
+        )
+        # 账户表变更时通过 NOTIFY 推送，供 watch_accounts_changes 监听；
+        # 可选功能，失败（无 plpgsql/权限不足）时仅告警，监听降级为轮询。
+        # 使用保存点，避免失败中止外层建表事务
+        try:
+            async with conn.transaction():
+                await conn.execute(
+                    f"""
+                    CREATE OR REPLACE FUNCTION notify_accounts_changed() RETURNS trigger AS $$
+                    BEGIN
+                        PERFORM pg_notify('{ACCOUNTS_CHANGED_CHANNEL}', '');
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql
+                    """
+                )
+                await conn.execute(
+                    """
+                    DO $$
+                    BEGIN
+                        IF NOT EXISTS (
+                            SELECT 1 FROM pg_trigger
+                            WHERE tgname = 'accounts_notify' AND tgrelid = 'accounts'::regclass
+                        ) THEN
+                            CREATE TRIGGER accounts_notify
+                            AFTER INSERT OR UPDATE OR DELETE ON accounts
+                            FOR EACH STATEMENT EXECUTE PROCEDURE notify_accounts_changed();
+                        END IF;
+                    END
+                    $$
+                    """
+                )
+        except Exception as e:
+            logger.warning(f"[STORAGE] Accounts change trigger unavailable, falling back to polling: {e}")
         logger.info("[STORAGE] Database tables initialized")
 
 
+@_on_db_loop
 async def db_get(key: str) -> Optional[dict]:
-    """Fetch a value from the database."""
+    """Fetch a value from the database (served from a short TTL cache when fresh)."""
+    cached = _kv_cache.get(key)
+    if cached and time.monotonic() - cached[0] < _KV_CACHE_TTL_SECONDS:
+        # 返回副本，避免调用方原地修改污染缓存
+        return copy.deepcopy(cached[1])
+
+    version = _kv_versions.get(key, 0)
     pool = await _get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow(
@@ -155,11 +283,12 @@ async def db_get(key: str) -> Optional[dict]:
         if not row:
             return None
         value = row["value"]
-        if isinstance(value, str):
-            return json.loads(value)
+        if _kv_versions.get(key, 0) == version:
+            _kv_cache[key] = (time.monotonic(), copy.deepcopy(value))
         return value
 
 
+@_on_db_loop
 async def db_set(key: str, value: dict) -> None:
     """Persist a value to the database."""
     pool = await _get_pool()
@@ -173,8 +302,12 @@ async def db_set(key: str, value: dict) -> None:
                 updated_at = CURRENT_TIMESTAMP
             """,
             key,
-            json.dumps(value, ensure_ascii=False),
+            value,
         )
+    # 写入后失效缓存（不复制写入值，统计数据较大且写入频繁）；
+    # 递增版本，使写入前发起的读取不会把旧值回填
+    _kv_versions[key] = next(_kv_write_counter)
+    _kv_cache.pop(key, None)
 
 
 # ==================== Accounts storage (独立表) ====================
@@ -187,10 +320,42 @@ ACCOUNT_FIELDS = [
     "mail_jwt_token", "mail_verify_ssl", "mail_domain", "mail_api_key"
 ]
 
+# 批量写入时 UNNEST 数组的元素类型（未列出的字段均为 text）
+_ACCOUNT_FIELD_TYPES = {"disabled": "boolean", "mail_verify_ssl": "boolean"}
+
+# 全量保存时账户数达到该值改用 COPY 写入
+_COPY_MIN_ACCOUNTS = 500
+
+# 账户相关 SQL 在导入时一次性生成，各函数直接引用
+_ACCOUNT_COLUMNS = ", ".join(ACCOUNT_FIELDS)
+_ACCOUNT_PLACEHOLDERS = ", ".join(f"${i+1}" for i in range(len(ACCOUNT_FIELDS)))
+_ACCOUNT_UNNEST_ARGS = ", ".join(
+    f"${i+1}::{_ACCOUNT_FIELD_TYPES.get(field, 'text')}[]"
+    for i, field in enumerate(ACCOUNT_FIELDS)
+)
+_ACCOUNT_UPSERT_CONFLICT = "ON CONFLICT (id) DO UPDATE SET " + ", ".join(
+    [f"{field} = EXCLUDED.{field}" for field in ACCOUNT_FIELDS if field != "id"]
+    + ["updated_at = CURRENT_TIMESTAMP"]
+)
+
+_SELECT_ACCOUNTS_SQL = f"SELECT {_ACCOUNT_COLUMNS} FROM accounts ORDER BY created_at"
+_UPSERT_ACCOUNT_SQL = (
+    f"INSERT INTO accounts ({_ACCOUNT_COLUMNS}) VALUES ({_ACCOUNT_PLACEHOLDERS}) "
+    f"{_ACCOUNT_UPSERT_CONFLICT}"
+)
+_BULK_UPSERT_ACCOUNTS_SQL = (
+    f"INSERT INTO accounts ({_ACCOUNT_COLUMNS}) SELECT * FROM UNNEST({_ACCOUNT_UNNEST_ARGS}) "
+    f"{_ACCOUNT_UPSERT_CONFLICT}"
+)
+_MERGE_STAGED_ACCOUNTS_SQL = (
+    f"INSERT INTO accounts ({_ACCOUNT_COLUMNS}) SELECT {_ACCOUNT_COLUMNS} FROM accounts_staging "
+    f"{_ACCOUNT_UPSERT_CONFLICT}"
+)
+
 
 def _account_row_to_dict(row) -> dict:
-    """将数据库行转换为账户字典"""
-    return {field: row[field] for field in ACCOUNT_FIELDS if field in row.keys()}
+    """将数据库行转换为账户字典（查询只选取 ACCOUNT_FIELDS 列）"""
+    return dict(row)
 
 
 def _account_dict_to_values(account: dict) -> tuple:
@@ -198,6 +363,7 @@ def _account_dict_to_values(account: dict) -> tuple:
     return tuple(account.get(field) for field in ACCOUNT_FIELDS)
 
 
+@_on_db_loop
 async def load_accounts() -> Optional[list]:
     """
     Load account configuration from database when enabled.
@@ -208,9 +374,7 @@ async def load_accounts() -> Optional[list]:
     try:
         pool = await _get_pool()
         async with pool.acquire() as conn:
-            rows = await conn.fetch(
-                f"SELECT {', '.join(ACCOUNT_FIELDS)} FROM accounts ORDER BY created_at"
-            )
+            rows = await conn.fetch(_SELECT_ACCOUNTS_SQL)
             accounts = [_account_row_to_dict(row) for row in rows]
             logger.info(f"[STORAGE] Loaded {len(accounts)} accounts from database")
             return accounts
@@ -219,6 +383,7 @@ async def load_accounts() -> Optional[list]:
     return None
 
 
+@_on_db_loop
 async def get_accounts_updated_at() -> Optional[float]:
     """
     Get the latest accounts updated_at timestamp (epoch seconds).
@@ -229,22 +394,60 @@ async def get_accounts_updated_at() -> Optional[float]:
     try:
         pool = await _get_pool()
         async with pool.acquire() as conn:
+            # 走 updated_at 索引取最新一行，epoch 转换放在客户端
             row = await conn.fetchrow(
-                "SELECT EXTRACT(EPOCH FROM MAX(updated_at)) AS ts FROM accounts"
+                """
+                SELECT updated_at FROM accounts
+                WHERE updated_at IS NOT NULL
+                ORDER BY updated_at DESC
+                LIMIT 1
+                """
             )
-            if not row or row["ts"] is None:
+            if not row:
                 return None
-            return float(row["ts"])
+            # updated_at 为不带时区的 TIMESTAMP，按 UTC 解释以与 EXTRACT(EPOCH ...) 结果一致
+            return row["updated_at"].replace(tzinfo=timezone.utc).timestamp()
     except Exception as e:
         logger.error(f"[STORAGE] Database accounts updated_at failed: {e}")
     return None
 
 
+async def watch_accounts_changes(callback) -> Optional[object]:
+    """
+    Watch account changes via LISTEN/NOTIFY on a dedicated connection.
+    callback() is called on the running loop for every change notification.
+    Return the listener connection (close it to stop watching), or None if unavailable.
+    """
+    if not is_database_enabled():
+        return None
+    try:
+        import asyncpg
+
+        # 确保表和触发器已初始化；监听连接独立于连接池，建在调用方的事件循环上
+        await _on_db_loop(_get_pool)()
+        conn = await asyncpg.connect(_get_database_url())
+
+        def _on_notify(connection, pid, channel, payload) -> None:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"[STORAGE] Accounts change callback failed: {e}")
+
+        await conn.add_listener(ACCOUNTS_CHANGED_CHANNEL, _on_notify)
+        logger.info("[STORAGE] Listening for accounts changes")
+        return conn
+    except Exception as e:
+        # 监听为可选功能，调用方会回退到轮询并定期重试，不按错误记录
+        logger.warning(f"[STORAGE] Accounts change watcher unavailable, polling instead: {e}")
+    return None
+
+
 def get_accounts_updated_at_sync() -> Optional[float]:
     """Sync wrapper for get_accounts_updated_at."""
     return _run_in_db_loop(get_accounts_updated_at())
 
 
+@_on_db_loop
 async def save_accounts(accounts: list) -> bool:
     """Save account configuration to database when enabled (全量更新)."""
     if not is_database_enabled():
@@ -253,44 +456,32 @@ async def save_accounts(accounts: list) -> bool:
         pool = await _get_pool()
         async with pool.acquire() as conn:
             async with conn.transaction():
-                # 获取现有账户 ID
-                existing_rows = await conn.fetch("SELECT id FROM accounts")
-                existing_ids = {row["id"] for row in existing_rows}
+                # 按 ID 去重（同 ID 以最后一条为准）
+                unique_accounts = {acc["id"]: acc for acc in accounts if acc.get("id")}
 
-                # 计算需要删除的账户
-                new_ids = {acc.get("id") for acc in accounts if acc.get("id")}
-                ids_to_delete = existing_ids - new_ids
-
-                # 删除不再存在的账户
-                if ids_to_delete:
-                    await conn.execute(
-                        "DELETE FROM accounts WHERE id = ANY($1)",
-                        list(ids_to_delete)
-                    )
+                # 删除不再存在的账户（在数据库内求差集，无需拉取全部 ID）
+                await conn.execute(
+                    "DELETE FROM accounts WHERE id <> ALL($1::text[])",
+                    list(unique_accounts)
+                )
 
                 # 插入或更新账户
-                for account in accounts:
-                    if not account.get("id"):
-                        continue
-
-                    # 构建 UPSERT 语句
-                    fields_str = ", ".join(ACCOUNT_FIELDS)
-                    placeholders = ", ".join(f"${i+1}" for i in range(len(ACCOUNT_FIELDS)))
-                    update_str = ", ".join(
-                        f"{field} = EXCLUDED.{field}"
-                        for field in ACCOUNT_FIELDS if field != "id"
-                    )
-
+                rows = list(unique_accounts.values())
+                if len(rows) >= _COPY_MIN_ACCOUNTS:
+                    # 大批量：COPY 二进制流写入临时表，再一次性合并
                     await conn.execute(
-                        f"""
-                        INSERT INTO accounts ({fields_str})
-                        VALUES ({placeholders})
-                        ON CONFLICT (id) DO UPDATE SET
-                            {update_str},
-                            updated_at = CURRENT_TIMESTAMP
-                        """,
-                        *_account_dict_to_values(account)
+                        "CREATE TEMP TABLE accounts_staging (LIKE accounts INCLUDING DEFAULTS) ON COMMIT DROP"
+                    )
+                    await conn.copy_records_to_table(
+                        "accounts_staging",
+                        records=[_account_dict_to_values(acc) for acc in rows],
+                        columns=ACCOUNT_FIELDS,
                     )
+                    await conn.execute(_MERGE_STAGED_ACCOUNTS_SQL)
+                elif rows:
+                    # 按列组装参数，一条 UNNEST 语句批量插入或更新
+                    columns = [[acc.get(field) for acc in rows] for field in ACCOUNT_FIELDS]
+                    await conn.execute(_BULK_UPSERT_ACCOUNTS_SQL, *columns)
 
             logger.info(f"[STORAGE] Saved {len(accounts)} accounts to database")
             return True
@@ -299,6 +490,7 @@ async def save_accounts(accounts: list) -> bool:
     return False
 
 
+@_on_db_loop
 async def save_account(account: dict) -> bool:
     """Save a single account to database (单个账户更新)."""
     if not is_database_enabled():
@@ -308,23 +500,8 @@ async def save_account(account: dict) -> bool:
     try:
         pool = await _get_pool()
         async with pool.acquire() as conn:
-            fields_str = ", ".join(ACCOUNT_FIELDS)
-            placeholders = ", ".join(f"${i+1}" for i in range(len(ACCOUNT_FIELDS)))
-            update_str = ", ".join(
-                f"{field} = EXCLUDED.{field}"
-                for field in ACCOUNT_FIELDS if field != "id"
-            )
-
-            await conn.execute(
-                f"""
-                INSERT INTO accounts ({fields_str})
-                VALUES ({placeholders})
-                ON CONFLICT (id) DO UPDATE SET
-                    {update_str},
-                    updated_at = CURRENT_TIMESTAMP
-                """,
-                *_account_dict_to_values(account)
-            )
+            # SQL 文本固定，asyncpg 按连接缓存预编译语句，后续调用跳过解析/规划
+            await conn.execute(_UPSERT_ACCOUNT_SQL, *_account_dict_to_values(account))
             logger.info(f"[STORAGE] Saved account {account.get('id')} to database")
             return True
     except Exception as e:
@@ -332,6 +509,7 @@ async def save_account(account: dict) -> bool:
     return False
 
 
+@_on_db_loop
 async def delete_account(account_id: str) -> bool:
     """Delete a single account from database."""
     if not is_database_enabled():
@@ -347,6 +525,7 @@ async def delete_account(account_id: str) -> bool:
     return False
 
 
+@_on_db_loop
 async def delete_accounts(account_ids: list) -> bool:
     """Delete multiple accounts from database."""
     if not is_database_enabled():
@@ -391,6 +570,7 @@ def delete_accounts_sync(account_ids: list) -> bool:
 
 # ==================== Settings storage ====================
 
+@_on_db_loop
 async def load_settings() -> Optional[dict]:
     if not is_database_enabled():
         return None
@@ -401,6 +581,7 @@ async def load_settings() -> Optional[dict]:
     return None
 
 
+@_on_db_loop
 async def save_settings(settings: dict) -> bool:
     if not is_database_enabled():
         return False
@@ -415,6 +596,7 @@ async def save_settings(settings: dict) -> bool:
 
 # ==================== Stats storage ====================
 
+@_on_db_loop
 async def load_stats() -> Optional[dict]:
     if not is_database_enabled():
         return None
@@ -425,6 +607,7 @@ async def load_stats() -> Optional[dict]:
     return None
 
 
+@_on_db_loop
 async def save_stats(stats: dict) -> bool:
     if not is_database_enabled():
         return False
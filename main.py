@@ -101,7 +101,7 @@ async def load_stats():
     data = None
     if storage.is_database_enabled():
         try:
-            data = await asyncio.to_thread(storage.load_stats_sync)
+            data = await storage.load_stats()
             if not isinstance(data, dict):
                 data = None
         except Exception as e:
@@ -152,7 +152,7 @@ async def save_stats(stats):
 
     if storage.is_database_enabled():
         try:
-            saved = await asyncio.to_thread(storage.save_stats_sync, stats_to_save)
+            saved = await storage.save_stats(stats_to_save)
             if saved:
                 return
         except Exception as e:
@@ -630,14 +630,19 @@ _last_known_accounts_version: float | None = None
 
 
 async def auto_refresh_accounts_task():
-    """后台任务：定期检查数据库中的账号变化，自动刷新"""
+    """后台任务：监听数据库中的账号变化（不支持时定期检查），自动刷新"""
     global multi_account_mgr, _last_known_accounts_version
 
-    # 初始化：记录当前账号更新时间
+    accounts_changed = asyncio.Event()
+    watcher = None
+    # 变更监听建立失败后的重试退避（秒），避免每次检查都重连并刷日志
+    watch_retry_delay = 0.0
+    watch_retry_at = 0.0
+
+    # 初始化：记录当前账号更新时间，并订阅账号变更通知
     if storage.is_database_enabled() and not os.environ.get("ACCOUNTS_CONFIG"):
-        _last_known_accounts_version = await asyncio.to_thread(
-            storage.get_accounts_updated_at_sync
-        )
+        _last_known_accounts_version = await storage.get_accounts_updated_at()
+        watcher = await storage.watch_accounts_changes(accounts_changed.set)
 
     while True:
         try:
@@ -648,7 +653,19 @@ async def auto_refresh_accounts_task():
                 await asyncio.sleep(60)
                 continue
 
-            await asyncio.sleep(refresh_interval)
+            notified = False
+            if watcher is not None and not watcher.is_closed():
+                # 推送模式：收到通知立即刷新；超时则回退到更新时间比较，兜底漏掉的通知
+                try:
+                    await asyncio.wait_for(accounts_changed.wait(), timeout=refresh_interval)
+                    # 合并短时间内的连续通知
+                    await asyncio.sleep(1)
+                    accounts_changed.clear()
+                    notified = True
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(refresh_interval)
 
             # 环境变量优先时无需自动刷新
             if os.environ.get("ACCOUNTS_CONFIG"):
@@ -659,29 +676,43 @@ async def auto_refresh_accounts_task():
                 continue
 
             # 获取数据库中的账号更新时间
-            db_version = await asyncio.to_thread(storage.get_accounts_updated_at_sync)
-            if db_version is None:
-                continue
+            db_version = await storage.get_accounts_updated_at()
+
+            # 未收到通知：比较更新时间变化，并尝试恢复变更监听
+            if not notified:
+                now = time.monotonic()
+                if (watcher is None or watcher.is_closed()) and now >= watch_retry_at:
+                    watcher = await storage.watch_accounts_changes(accounts_changed.set)
+                    if watcher is None:
+                        watch_retry_delay = min(max(watch_retry_delay * 2, refresh_interval), 3600)
+                        watch_retry_at = now + watch_retry_delay
+                    else:
+                        watch_retry_delay = 0.0
+                if db_version is None or _last_known_accounts_version == db_version:
+                    continue
 
-            # 比较更新时间变化
-            if _last_known_accounts_version != db_version:
-                logger.info("[AUTO-REFRESH] 检测到账号变化，正在自动刷新...")
-
-                # 重新加载账号配置
-                multi_account_mgr = _reload_accounts(
-                    multi_account_mgr,
-                    http_client,
-                    USER_AGENT,
-                    ACCOUNT_FAILURE_THRESHOLD,
-                    RATE_LIMIT_COOLDOWN_SECONDS,
-                    SESSION_CACHE_TTL_SECONDS,
-                    global_stats
-                )
+            logger.info("[AUTO-REFRESH] 检测到账号变化，正在自动刷新...")
+
+            # 重新加载账号配置
+            multi_account_mgr = _reload_accounts(
+                multi_account_mgr,
+                http_client,
+                USER_AGENT,
+                ACCOUNT_FAILURE_THRESHOLD,
+                RATE_LIMIT_COOLDOWN_SECONDS,
+                SESSION_CACHE_TTL_SECONDS,
+                global_stats
+            )
 
-                _last_known_accounts_version = db_version
-                logger.info(f"[AUTO-REFRESH] 账号刷新完成，当前账号数: {len(multi_account_mgr.accounts)}")
+            _last_known_accounts_version = db_version
+            logger.info(f"[AUTO-REFRESH] 账号刷新完成，当前账号数: {len(multi_account_mgr.accounts)}")
 
         except asyncio.CancelledError:
+            if watcher is not None:
+                try:
+                    await watcher.close()
+                except Exception:
+                    pass
             logger.info("[AUTO-REFRESH] 自动刷新任务已停止")
             break
         except Exception as e: